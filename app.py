@@ -1,9 +1,13 @@
 import os
+import re
+import shutil
+import functools
 import uuid
 import json
+import sqlite3
 import threading
-import time
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 from flask import (
@@ -12,43 +16,187 @@ from flask import (
     redirect,
     url_for,
     send_file,
-    render_template_string,
+    send_from_directory,
+    render_template,
     abort
 )
 
+from flask_caching import Cache
+
 import yt_dlp
 
 app = Flask(__name__)
+cache = Cache(app, config={"CACHE_TYPE": "SimpleCache"})
 
 DOWNLOAD_DIR = "downloads"
-DB_FILE = os.path.join(DOWNLOAD_DIR, "database.json")
+DB_FILE = os.path.join(DOWNLOAD_DIR, "database.db")
+LEGACY_DB_FILE = os.path.join(DOWNLOAD_DIR, "database.json")
 
 # =========================
 # CONFIG (change this)
 # =========================
 DELETE_AFTER_HOURS = 48   # <-- change retention here
+RECENT_LIMIT = 100        # videos listed on the home page
+ROTATE_WITH_METADATA = True   # False re-encodes with the transpose filter
+VAAPI_DEVICE = "/dev/dri/renderD128"
+
+# Hand file bodies to the front-end server (Apache mod_xsendfile, lighttpd)
+# via X-Sendfile. Without a proxy, gunicorn sends them with sendfile(2).
+app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE") == "1"
 
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
 db_lock = threading.Lock()
+cleanup_event = threading.Event()
+
+# Shared by all workers of one server start (see gunicorn.conf.py)
+BOOT_ID = os.environ.setdefault("BOOT_ID", uuid.uuid4().hex)
 
 
 # -------------------------
 # Database helpers
 # -------------------------
 
-def load_db():
+VIDEO_COLUMNS = ("id", "url", "status", "created", "file", "hls", "error", "owner")
+
+# Statuses that mean a job is running under the owner boot
+JOB_STATUSES = ("queued", "downloading", "converting", "rotating")
+
+db = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None)
+db.row_factory = sqlite3.Row
+db.execute("PRAGMA journal_mode=WAL")
+db.execute("PRAGMA synchronous=NORMAL")
+db.execute("""
+    CREATE TABLE IF NOT EXISTS videos (
+        id TEXT PRIMARY KEY,
+        url TEXT,
+        status TEXT,
+        created TEXT,
+        file TEXT,
+        hls TEXT,
+        error TEXT,
+        owner TEXT
+    )
+""")
+db.execute("CREATE INDEX IF NOT EXISTS videos_created ON videos (created)")
+db.execute("CREATE INDEX IF NOT EXISTS videos_url ON videos (url)")
+
+
+def get_video(video_id):
+    with db_lock:
+        row = db.execute(
+            "SELECT * FROM videos WHERE id = ?", (video_id,)
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def list_videos(limit=-1):
+    with db_lock:
+        rows = db.execute(
+            "SELECT * FROM videos ORDER BY created DESC LIMIT ?", (limit,)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def find_video_by_url(url):
+    # Latest submission of this URL that is ready or still on its way
+    with db_lock:
+        row = db.execute(
+            "SELECT * FROM videos WHERE url = ? AND status != 'failed' "
+            "ORDER BY created DESC LIMIT 1", (url,)
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def insert_video(video):
+    with db_lock:
+        db.execute(
+            "INSERT OR IGNORE INTO videos (id, url, status, created, file, hls, error, owner) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            tuple(video.get(column) for column in VIDEO_COLUMNS)
+        )
+    cache.clear()
+    cleanup_event.set()
+
+
+def update_video(video_id, **fields):
+    assignments = ", ".join(f"{column} = ?" for column in fields)
     with db_lock:
-        if not os.path.exists(DB_FILE):
-            return {}
-        with open(DB_FILE, "r") as f:
-            return json.load(f)
+        db.execute(
+            f"UPDATE videos SET {assignments} WHERE id = ?",
+            (*fields.values(), video_id)
+        )
+    cache.clear()
+
+
+def update_video_if(video_id, expected_status, **fields):
+    # Compare-and-set on status, False if another request got there first
+    assignments = ", ".join(f"{column} = ?" for column in fields)
+    with db_lock:
+        cursor = db.execute(
+            f"UPDATE videos SET {assignments} WHERE id = ? AND status = ?",
+            (*fields.values(), video_id, expected_status)
+        )
+    if not cursor.rowcount:
+        return False
+    cache.clear()
+    return True
+
+
+def oldest_created():
+    with db_lock:
+        row = db.execute("SELECT MIN(created) FROM videos").fetchone()
+    return row[0]
+
+
+def delete_videos_before(cutoff_iso):
+    with db_lock:
+        rows = db.execute(
+            "SELECT file, hls FROM videos WHERE created < ?", (cutoff_iso,)
+        ).fetchall()
+        db.execute("DELETE FROM videos WHERE created < ?", (cutoff_iso,))
+    if rows:
+        cache.clear()
+    return rows
+
+
+def migrate_json_db():
+    # One-time import of the old database.json store. Every gunicorn worker
+    # runs this at import, so the rename doubles as the lock: only one wins.
+    migrated = LEGACY_DB_FILE + ".migrated"
+    try:
+        os.rename(LEGACY_DB_FILE, migrated)
+    except FileNotFoundError:
+        return
+
+    with open(migrated, "r") as f:
+        legacy = json.load(f)
+
+    for video in legacy.values():
+        insert_video(video)
+
+
+migrate_json_db()
 
 
-def save_db(db):
+def recover_jobs():
+    # Jobs only live in the pools of this server start. Rows left behind by
+    # an earlier start would stay busy until expiry.
     with db_lock:
-        with open(DB_FILE, "w") as f:
-            json.dump(db, f)
+        rows = db.execute(
+            "SELECT id, status FROM videos WHERE status IN (?, ?, ?, ?) "
+            "AND owner IS NOT ?",
+            (*JOB_STATUSES, BOOT_ID)
+        ).fetchall()
+
+    for row in rows:
+        if row["status"] == "rotating":
+            update_video(row["id"], status="ready", error="Rotation interrupted")
+        else:
+            update_video(row["id"], status="failed", error="Interrupted by a restart")
+
+
+recover_jobs()
 
 
 # -------------------------
@@ -57,31 +205,29 @@ def save_db(db):
 
 def cleanup_loop():
     while True:
-        db = load_db()
-        now = datetime.utcnow()
-        changed = False
-
-        for vid in list(db.keys()):
-            created = datetime.fromisoformat(db[vid]["created"])
-            if now - created > timedelta(hours=DELETE_AFTER_HOURS):
+        cutoff = datetime.utcnow() - timedelta(hours=DELETE_AFTER_HOURS)
 
-                filepath = db[vid].get("file")
-                if filepath and os.path.exists(filepath):
+        for video in delete_videos_before(cutoff.isoformat()):
+            filepath = video["file"]
+            if filepath:
+                try:
                     os.remove(filepath)
+                except FileNotFoundError:
+                    pass
 
-                hls_dir = db[vid].get("hls")
-                if hls_dir and os.path.exists(hls_dir):
-                    for f in os.listdir(hls_dir):
-                        os.remove(os.path.join(hls_dir, f))
-                    os.rmdir(hls_dir)
+            hls_dir = video["hls"]
+            if hls_dir:
+                shutil.rmtree(hls_dir, ignore_errors=True)
 
-                del db[vid]
-                changed = True
+        # Sleep until the oldest video expires, or a new one is added
+        timeout = None
+        oldest = oldest_created()
+        if oldest:
+            expires = datetime.fromisoformat(oldest) + timedelta(hours=DELETE_AFTER_HOURS)
+            timeout = max(0, (expires - datetime.utcnow()).total_seconds())
 
-        if changed:
-            save_db(db)
-
-        time.sleep(1800)
+        cleanup_event.wait(timeout)
+        cleanup_event.clear()
 
 
 threading.Thread(target=cleanup_loop, daemon=True).start()
@@ -91,8 +237,65 @@ threading.Thread(target=cleanup_loop, daemon=True).start()
 # HLS conversion
 # -------------------------
 
+def hls_options(output_dir, prefix):
+    # fMP4 init segments can carry the MP4's rotation matrix (MPEG-TS has no
+    # place for it); whether it is applied is up to the player.
+    # Names are unique per conversion, so segments can be cached as immutable.
+    return {
+        "hls_time": "6",
+        "hls_playlist_type": "vod",
+        "hls_list_size": "0",
+        "hls_segment_type": "fmp4",
+        "hls_fmp4_init_filename": f"{prefix}_init.mp4",
+        "hls_segment_filename": os.path.join(output_dir, f"{prefix}_%03d.m4s")
+    }
+
+
+def hls_output_args(output_dir, prefix):
+    args = ["-f", "hls"]
+    for name, value in hls_options(output_dir, prefix).items():
+        args += [f"-{name}", value]
+    # Written under the prefix, publish_hls() swaps it in once complete
+    args.append(os.path.join(output_dir, f"{prefix}.m3u8"))
+    return args
+
+
+def hls_tee_output(output_dir, prefix):
+    # Same HLS settings, in tee muxer slave syntax
+    options = ":".join(f"{k}={v}" for k, v in hls_options(output_dir, prefix).items())
+    return f"[f=hls:{options}]{os.path.join(output_dir, f'{prefix}.m3u8')}"
+
+
+def prune_hls(output_dir, prefix):
+    # Drop segments left over from earlier conversions
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            if entry.name != "playlist.m3u8" and not entry.name.startswith(prefix):
+                os.remove(entry.path)
+
+
+def publish_hls(output_dir, prefix):
+    os.replace(
+        os.path.join(output_dir, f"{prefix}.m3u8"),
+        os.path.join(output_dir, "playlist.m3u8")
+    )
+    prune_hls(output_dir, prefix)
+
+
+def discard_hls(output_dir, prefix):
+    # Partial output of a failed conversion
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith(prefix):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
 def start_hls_conversion(input_path, output_dir):
     os.makedirs(output_dir, exist_ok=True)
+    prefix = uuid.uuid4().hex[:8]
 
     cmd = [
         "ffmpeg",
@@ -100,50 +303,112 @@ def start_hls_conversion(input_path, output_dir):
         "-i", input_path,
         "-c:v", "copy",
         "-c:a", "copy",
-        "-f", "hls",
-        "-hls_time", "6",
-        "-hls_playlist_type", "vod",
-        "-hls_list_size", "0",
-        "-hls_segment_filename",
-        os.path.join(output_dir, "seg_%03d.ts"),
-        os.path.join(output_dir, "playlist.m3u8")
+        *hls_output_args(output_dir, prefix)
     ]
 
-    subprocess.run(cmd, check=True)
+    try:
+        subprocess.run(cmd, check=True)
+    except Exception:
+        discard_hls(output_dir, prefix)
+        raise
+
+    publish_hls(output_dir, prefix)
+
+
+# Preferred first: (input args, filter chain suffix, encoder args)
+HW_H264_ENCODERS = {
+    "h264_nvenc": (
+        ["-hwaccel", "cuda"], "", ["-c:v", "h264_nvenc", "-preset", "p4"]
+    ),
+    "h264_qsv": (
+        [], "", ["-c:v", "h264_qsv"]
+    ),
+    "h264_vaapi": (
+        ["-vaapi_device", VAAPI_DEVICE], ",format=nv12,hwupload", ["-c:v", "h264_vaapi"]
+    )
+}
+SOFTWARE_H264 = ([], "", ["-c:v", "libx264"])
+
+
+@functools.cache
+def h264_encoder():
+    try:
+        listed = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"],
+            capture_output=True, text=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return SOFTWARE_H264
+
+    for name, (input_args, filter_suffix, encoder_args) in HW_H264_ENCODERS.items():
+        if f" {name} " not in listed:
+            continue
+
+        # Distro builds list every encoder they were compiled with,
+        # so make sure the hardware is actually usable
+        probe = subprocess.run([
+            "ffmpeg",
+            "-v", "error",
+            *input_args,
+            "-f", "lavfi",
+            "-i", "color=size=256x256:duration=0.1",
+            "-vf", "null" + filter_suffix,
+            "-frames:v", "1",
+            *encoder_args,
+            "-f", "null", "-"
+        ], capture_output=True)
+
+        if probe.returncode == 0:
+            return input_args, filter_suffix, encoder_args
+
+    return SOFTWARE_H264
+
+
+if not ROTATE_WITH_METADATA:
+    threading.Thread(target=h264_encoder, daemon=True).start()
 
 
 def ensure_hls(video_id, video):
     input_file = video.get("file")
     hls_dir = video.get("hls")
 
+    # Running jobs package HLS themselves once their MP4 is final. A failed
+    # row may still have a good MP4 whose HLS step failed, so retry those.
+    status = video.get("status")
+    if status in JOB_STATUSES:
+        return bool(hls_dir) and os.path.exists(os.path.join(hls_dir, "playlist.m3u8"))
+
     if not input_file or not os.path.exists(input_file):
         return False
 
     if not hls_dir:
         hls_dir = os.path.join(DOWNLOAD_DIR, f"{video_id}_hls")
         video["hls"] = hls_dir
-
-        db = load_db()
-        db[video_id] = video
-        save_db(db)
+        update_video(video_id, hls=hls_dir)
 
     playlist = os.path.join(hls_dir, "playlist.m3u8")
 
     if os.path.exists(playlist):
         return True
 
+    # Claim the row first: both gunicorn workers repair at boot, and
+    # concurrent playlist requests would otherwise convert the same dir
+    if not update_video_if(video_id, status, status="converting", owner=BOOT_ID):
+        return False
+
     try:
         start_hls_conversion(input_file, hls_dir)
-    except Exception:
+    except Exception as e:
+        update_video(video_id, status=status, error=str(e))
         return False
 
+    update_video(video_id, status="ready", error=None)
     return os.path.exists(playlist)
 
 
 def repair_hls():
-    db = load_db()
-    for vid, video in db.items():
-        ensure_hls(vid, video)
+    for video in list_videos():
+        ensure_hls(video["id"], video)
 
 
 threading.Thread(target=repair_hls, daemon=True).start()
@@ -153,58 +418,186 @@ threading.Thread(target=repair_hls, daemon=True).start()
 # Download worker
 # -------------------------
 
-MAX_CONCURRENT_JOBS = 2
-job_semaphore = threading.Semaphore(MAX_CONCURRENT_JOBS)
+# Mostly network-bound, HLS packaging is a stream copy
+MAX_CONCURRENT_DOWNLOADS = 2
+download_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOADS)
 
 
 def download_video(video_id, url):
+    filename = f"{video_id}.mp4"
+    filepath = os.path.join(DOWNLOAD_DIR, filename)
+    hls_dir = os.path.join(DOWNLOAD_DIR, f"{video_id}_hls")
+
+    started = threading.Event()
+
+    def on_progress(d):
+        # First callback means yt-dlp has opened the file
+        if d["status"] == "downloading" and not started.is_set():
+            started.set()
+            update_video(video_id, status="downloading")
+
+    ydl_opts: yt_dlp._Params = {
+        "outtmpl": filepath,
+        "progress_hooks": [on_progress],
+        "format": "bv*+ba/best",
+        "merge_output_format": "mp4",
+        "postprocessors": [{
+            "key": "FFmpegVideoRemuxer",
+            "preferedformat": "mp4"
+        }],
+        "postprocessor_args": ["-movflags", "+faststart"]
+    }
 
-    def worker():
-        with job_semaphore:
+    try:
+        update_video(video_id, file=filepath, hls=hls_dir)
 
-            db = load_db()
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            ydl.download([url])
 
-            filename = f"{video_id}.mp4"
-            filepath = os.path.join(DOWNLOAD_DIR, filename)
-            hls_dir = os.path.join(DOWNLOAD_DIR, f"{video_id}_hls")
+        update_video(video_id, status="converting")
 
-            db[video_id]["file"] = filepath
-            db[video_id]["hls"] = hls_dir
-            db[video_id]["status"] = "downloading"
-            save_db(db)
+        start_hls_conversion(filepath, hls_dir)
 
-            ydl_opts: yt_dlp._Params = {
-                "outtmpl": filepath,
-                "format": "bv*+ba/best",
-                "merge_output_format": "mp4",
-                "postprocessors": [{
-                    "key": "FFmpegVideoRemuxer",
-                    "preferedformat": "mp4"
-                }],
-                "postprocessor_args": ["-movflags", "+faststart"]
-            }
+        update_video(video_id, status="ready")
 
-            try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([url])
+    except Exception as e:
+        update_video(video_id, status="failed", error=str(e))
 
-                db = load_db()
-                db[video_id]["status"] = "converting"
-                save_db(db)
 
-                start_hls_conversion(filepath, hls_dir)
+# -------------------------
+# Rotate worker
+# -------------------------
 
-                db = load_db()
-                db[video_id]["status"] = "ready"
-                save_db(db)
+# Sized for the transpose re-encode; kept apart from downloads so a
+# rotation never waits behind a long download
+FFMPEG_THREADS = 4
+MAX_CONCURRENT_ROTATIONS = max(1, (os.cpu_count() or 1) // FFMPEG_THREADS)
+rotate_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_ROTATIONS)
+
+# Clockwise angle -> ffmpeg filter for the re-encode path
+TRANSPOSE = {
+    "90": "transpose=1",
+    "180": "transpose=2,transpose=2",
+    "270": "transpose=2"
+}
 
-            except Exception as e:
-                db = load_db()
-                db[video_id]["status"] = "failed"
-                db[video_id]["error"] = str(e)
-                save_db(db)
 
-    threading.Thread(target=worker, daemon=True).start()
+@functools.cache
+def ffmpeg_major_version():
+    try:
+        out = subprocess.run(
+            ["ffmpeg", "-version"],
+            capture_output=True, text=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    match = re.match(r"ffmpeg version n?(\d+)\.", out)
+    return int(match.group(1)) if match else None
+
+
+def probe_rotation(path):
+    # Clockwise degrees players rotate the first video stream by
+    out = subprocess.run([
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream_tags=rotate:stream_side_data=rotation",
+        "-of", "json",
+        path
+    ], capture_output=True, text=True, check=True).stdout
+
+    streams = json.loads(out).get("streams") or [{}]
+    for side_data in streams[0].get("side_data_list", []):
+        if "rotation" in side_data:
+            # Display matrix angles are counter-clockwise
+            return round(-float(side_data["rotation"])) % 360
+
+    return round(float(streams[0].get("tags", {}).get("rotate", 0))) % 360
+
+
+def rotation_args(rotation):
+    # (input args, output args) setting an absolute clockwise rotation.
+    # ffmpeg 6 added -display_rotation (counter-clockwise) and ffmpeg 7
+    # dropped the rotate tag; unknown versions are git builds, so new.
+    version = ffmpeg_major_version()
+    if version is None or version >= 6:
+        return ["-display_rotation:v:0", str((360 - rotation) % 360)], []
+    return [], ["-metadata:s:v:0", f"rotate={rotation}"]
+
+
+def rotate_video(video, angle, transpose):
+    video_id = video["id"]
+    input_file = video["file"]
+    hls_dir = video.get("hls") or os.path.join(DOWNLOAD_DIR, f"{video_id}_hls")
+    output_file = input_file.replace(".mp4", "_rotated.mp4")
+    prefix = uuid.uuid4().hex[:8]
+
+    # Only rotate() submits this, and only for ready videos
+    try:
+        if not video.get("hls"):
+            update_video(video_id, hls=hls_dir)
+
+        os.makedirs(hls_dir, exist_ok=True)
+
+        if ROTATE_WITH_METADATA:
+            # Stream copy, only the rotation changes. Start from the file's
+            # own rotation so phone footage keeps its orientation.
+            rotation = (probe_rotation(input_file) + int(angle)) % 360
+            input_args, output_args = rotation_args(rotation)
+            stream_args = [
+                "-map", "0:v:0",
+                "-map", "0:a?",
+                "-c", "copy",
+                *output_args
+            ]
+
+            cmd = [
+                "ffmpeg",
+                "-y",
+                *input_args,
+                "-i", input_file,
+                *stream_args,
+                "-movflags", "+faststart",
+                output_file,
+                *stream_args,
+                *hls_output_args(hls_dir, prefix)
+            ]
+        else:
+            # Encode once, mux the result to both the MP4 and the HLS playlist.
+            # Any previous rotation tag is applied to the pixels by ffmpeg.
+            input_args, filter_suffix, encoder_args = h264_encoder()
+            cmd = [
+                "ffmpeg",
+                "-y",
+                *input_args,
+                "-i", input_file,
+                "-map", "0:v:0",
+                "-map", "0:a?",
+                "-vf", transpose + filter_suffix,
+                *encoder_args,
+                "-threads", str(FFMPEG_THREADS),
+                "-c:a", "copy",
+                "-flags", "+global_header",
+                "-f", "tee",
+                f"[f=mp4:movflags=+faststart]{output_file}|{hls_tee_output(hls_dir, prefix)}"
+            ]
+
+        subprocess.run(cmd, check=True)
+        os.replace(output_file, input_file)
+        publish_hls(hls_dir, prefix)
+        update_video(video_id, status="ready", error=None)
+
+    except Exception as e:
+        # Keep the previous MP4 and playlist, drop what this run wrote
+        try:
+            os.remove(output_file)
+        except FileNotFoundError:
+            pass
+        if os.path.isdir(hls_dir):
+            discard_hls(hls_dir, prefix)
+
+        update_video(video_id, status="ready", error=str(e))
 
 
 # -------------------------
@@ -223,230 +616,61 @@ def hours_remaining(created_iso):
 # Routes
 # -------------------------
 
-BASE_STYLE = """
-<meta name="viewport" content="width=device-width, initial-scale=1, shrink-to-fit=no" />
-<style>
-* { box-sizing: border-box; }
-body {
-    margin: 0;
-    font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif;
-    background: #0f172a;
-    color: #e5e7eb;
-}
-.header {
-    display: flex;
-    align-items: center;
-    gap: 12px;
-    margin-bottom: 12px;
-}
-.back {
-    background: #1f2937;
-    border: none;
-    color: white;
-    padding: 10px 14px;
-    border-radius: 10px;
-    font-size: 14px;
-}
-.container {
-    max-width: 640px;
-    margin: auto;
-    padding: 16px;
-}
-.card {
-    background: #111827;
-    border-radius: 16px;
-    padding: 16px;
-    margin-bottom: 16px;
-    box-shadow: 0 4px 20px rgba(0,0,0,0.4);
-}
-h1, h2, h3 {
-    margin-top: 0;
-}
-input {
-    width: 100%;
-    padding: 14px;
-    border-radius: 12px;
-    border: none;
-    margin-bottom: 10px;
-    font-size: 16px;
-}
-button {
-    width: 100%;
-    padding: 14px;
-    border-radius: 12px;
-    border: none;
-    background: #3b82f6;
-    color: white;
-    font-weight: 600;
-    font-size: 16px;
-}
-button.secondary {
-    background: #374151;
-}
-a {
-    color: #60a5fa;
-    text-decoration: none;
-    word-break: break-all;
-}
-.video-item {
-    padding: 10px 0;
-    border-bottom: 1px solid #1f2937;
-}
-.status {
-    font-size: 14px;
-    opacity: 0.8;
-}
-video {
-    width: 100%;
-    border-radius: 12px;
-    background: black;
-}
-.actions {
-    display: grid;
-    grid-template-columns: 1fr 1fr 1fr;
-    gap: 8px;
-    margin-top: 12px;
-}
-.footer {
-    margin-top: 20px;
-    text-align: center;
-    font-size: 14px;
-    opacity: 0.6;
-}
-</style>
-"""
-
-
 @app.route("/", methods=["GET", "POST"])
+@cache.cached(timeout=5, unless=lambda: request.method != "GET")
 def home():
-    db = load_db()
-
     if request.method == "POST":
         url = request.form["url"]
+
+        existing = find_video_by_url(url)
+        if existing:
+            return redirect(url_for("video_page", video_id=existing["id"]))
+
         video_id = str(uuid.uuid4())
 
-        db[video_id] = {
+        insert_video({
             "id": video_id,
             "url": url,
             "status": "queued",
             "created": datetime.utcnow().isoformat(),
             "file": "",
-            "hls": ""
-        }
+            "hls": "",
+            "owner": BOOT_ID
+        })
 
-        save_db(db)
-        download_video(video_id, url)
+        download_pool.submit(download_video, video_id, url)
 
-        return redirect(url_for("home"))
+        # Not home: its cache is per process and may predate this video
+        return redirect(url_for("video_page", video_id=video_id))
 
-    videos = list(db.values())[::-1]
+    videos = list_videos(RECENT_LIMIT)
 
     enriched = []
     for v in videos:
         hrs, exp = hours_remaining(v["created"])
         enriched.append({**v, "hours_left": hrs, "expires": exp})
 
-    return render_template_string(f"""
-    {BASE_STYLE}
-    <div class="container">
-
-        <div class="card">
-            <h1>📥 Video Downloader</h1>
-            <form method="POST">
-                <input name="url" placeholder="Paste video link..." required>
-                <button>Download</button>
-            </form>
-        </div>
-
-        <div class="card">
-            <h2>Recent</h2>
-
-            {{% for v in videos %}}
-                <div class="video-item">
-                    <a href="/video/{{{{v.id}}}}">{{{{v.url}}}}</a>
-                    <div class="status">
-                        Status: {{{{v.status}}}} • Deletes in {{{{v.hours_left}}}}h
-                    </div>
-                </div>
-            {{% endfor %}}
-
-            {{% if not videos %}}
-                <div class="status">No downloads yet</div>
-            {{% endif %}}
-        </div>
-
-        <div class="footer">
-            Files auto-delete after {DELETE_AFTER_HOURS} hours
-        </div>
-
-    </div>
-    """, videos=enriched)
+    return render_template(
+        "home.html",
+        videos=enriched,
+        delete_after_hours=DELETE_AFTER_HOURS
+    )
 
 
 @app.route("/video/<video_id>")
 def video_page(video_id):
-    db = load_db()
-
-    if video_id not in db:
+    video = get_video(video_id)
+    if not video:
         return "Not found"
 
-    video = db[video_id]
     hrs, exp = hours_remaining(video["created"])
 
-    return render_template_string(f"""
-    {BASE_STYLE}
-    <div class="container">
-
-        <div class="header">
-            <a href="/"><button class="back">← Back</button></a>
-            <div>
-                <div><strong>Video</strong></div>
-                <div class="status">
-                    Status: {{{{video.status}}}} • Deletes in {hrs}h
-                </div>
-            </div>
-        </div>
-
-        <div class="card">
-
-            <video id="video" controls playsinline></video>
-
-            <script src="https://cdn.jsdelivr.net/npm/hls.js@latest"></script>
-
-            <script>
-            const video = document.getElementById('video');
-            const src = "/hls/{{{{video.id}}}}/playlist.m3u8";
-
-            if (video.canPlayType('application/vnd.apple.mpegurl')) {{
-                video.src = src;
-            }} else if (Hls.isSupported()) {{
-                const hls = new Hls();
-                hls.loadSource(src);
-                hls.attachMedia(video);
-            }}
-            </script>
-
-            <br>
-
-            <a href="/download/{{{{video.id}}}}">
-                <button>⬇️ Download MP4</button>
-            </a>
-
-            <div class="actions">
-                <form method="POST" action="/rotate/{{{{video.id}}}}/90">
-                    <button class="secondary">90°</button>
-                </form>
-                <form method="POST" action="/rotate/{{{{video.id}}}}/180">
-                    <button class="secondary">180°</button>
-                </form>
-                <form method="POST" action="/rotate/{{{{video.id}}}}/270">
-                    <button class="secondary">270°</button>
-                </form>
-            </div>
-
-        </div>
-    </div>
-    """, video=video)
+    return render_template(
+        "video.html",
+        video=video,
+        hrs=hrs,
+        busy=video["status"] in JOB_STATUSES
+    )
 
 
 # -------------------------
@@ -455,78 +679,61 @@ def video_page(video_id):
 
 @app.route("/hls/<video_id>/<path:filename>")
 def hls(video_id, filename):
-    db = load_db()
-
-    video = db.get(video_id)
+    video = get_video(video_id)
     if not video:
         return abort(404, description="Video not found")
 
-    if not ensure_hls(video_id, video):
+    # Players fetch the playlist before any segment, so only the playlist
+    # request needs to check (and repair) the HLS output
+    if filename == "playlist.m3u8" and not ensure_hls(video_id, video):
         return abort(404, description="HLS not ready")
 
     hls_dir = video.get("hls")
-    path = os.path.join(hls_dir, filename)
+    if not hls_dir:
+        return abort(404, description="HLS not ready")
 
-    if not os.path.exists(path):
-        return abort(404, description="File not found")
+    # send_from_directory rejects paths escaping hls_dir and 404s missing files.
+    # The playlist is rewritten by rotate(), segment names never are.
+    if filename.endswith(".m3u8"):
+        return send_from_directory(hls_dir, filename, conditional=True, max_age=0)
 
-    return send_file(path)
+    resp = send_from_directory(hls_dir, filename, conditional=True, max_age=3600)
+    resp.headers["Cache-Control"] = "public, max-age=3600, immutable"
+    return resp
 
 
 @app.route("/download/<video_id>")
 def download(video_id):
-    db = load_db()
-
-    video = db.get(video_id)
+    video = get_video(video_id)
     if not video:
         return abort(404, description="Video not found")
 
     video_file = video.get("file")
-    if not video_file or not os.path.exists(video_file):
+    if not video_file:
         return abort(404, description="Video file not found")
 
-    return send_file(video_file, as_attachment=True)
+    # send_file stats the file itself, no need for an exists() check first
+    try:
+        return send_file(video_file, as_attachment=True)
+    except FileNotFoundError:
+        return abort(404, description="Video file not found")
 
 
 @app.route("/rotate/<video_id>/<angle>", methods=["POST"])
 def rotate(video_id, angle):
-    db = load_db()
-
-    video = db.get(video_id)
+    video = get_video(video_id)
     if not video:
         return abort(404, description="Video not found")
 
-    input_file = video["file"]
-    hls_dir = video.get("hls")
-
-    output_file = input_file.replace(".mp4", "_rotated.mp4")
-
-    transpose = {
-        "90": "transpose=1",
-        "180": "transpose=2,transpose=2",
-        "270": "transpose=2"
-    }[angle]
-
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-i", input_file,
-        "-vf", transpose,
-        "-c:a", "copy",
-        "-movflags", "+faststart",
-        output_file
-    ]
+    transpose = TRANSPOSE.get(angle)
+    if not transpose:
+        return abort(400, description="Unsupported angle")
 
-    subprocess.run(cmd, check=True)
+    if not update_video_if(video_id, "ready", status="rotating", owner=BOOT_ID):
+        return abort(409, description="Video is busy")
 
-    os.remove(input_file)
-    os.rename(output_file, input_file)
-
-    if hls_dir:
-        try:
-            start_hls_conversion(input_file, hls_dir)
-        except Exception:
-            pass
+    # Re-read now that this request owns the row
+    rotate_pool.submit(rotate_video, get_video(video_id), angle, transpose)
 
     return redirect(url_for("video_page", video_id=video_id))
 
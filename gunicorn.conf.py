@@ -0,0 +1,8 @@
+import os
+import uuid
+
+
+def on_starting(server):
+    # One token per server start, inherited by every worker. Jobs owned by
+    # any other token were left behind by an earlier start.
+    os.environ["BOOT_ID"] = uuid.uuid4().hex